@@ -1,4 +1,5 @@
 """Functions for finding and manipulating data locations."""
+import os
 from pathlib import Path
 
 
@@ -14,13 +15,18 @@ def parse_path(file_path: Path) -> Path:
     Raises:
         ValueError: The supplied path does not exist.
     """
-    path = file_path.expanduser().resolve()
+    # Make the path absolute without resolving symlinks, which costs a stat per part
+    path = Path(os.path.abspath(os.path.expanduser(file_path)))
 
-    if path.exists():
-        return path
-    # TODO: perhaps log the path here?
-    else:
-        raise ValueError(f"Supplied path: {path} does not exist.")
+    # A single stat checks that the path exists. Other errors, such as a missing
+    # permission, are raised as they are
+    try:
+        os.stat(path)
+    except (FileNotFoundError, NotADirectoryError) as err:
+        # TODO: perhaps log the path here?
+        raise ValueError(f"Supplied path: {path} does not exist.") from err
+
+    return path
 
 
 def find_geojson(directory: Path) -> list[Path]:
@@ -35,11 +41,14 @@ def find_geojson(directory: Path) -> list[Path]:
         be empty.
     """
     validated_directory = parse_path(directory)
-    files = [
-        file
-        for file in validated_directory.iterdir()
-        if (file.is_file() and file.suffix == ".geojson")
-    ]
+
+    # DirEntry.is_file() uses the type from the directory listing, avoiding a stat call
+    with os.scandir(validated_directory) as entries:
+        files = [
+            Path(entry.path)
+            for entry in entries
+            if (entry.is_file() and entry.name.endswith(".geojson"))
+        ]
     # TODO: log any files found.
 
     return files
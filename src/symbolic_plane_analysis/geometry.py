@@ -6,7 +6,7 @@ features. There are some geospatial operations, but they are coordinate system a
 
 import pathlib
 
-import geopandas as gpd
+import numpy as np
 import numpy.typing as npt
 import shapely
 
@@ -31,9 +31,34 @@ def load_geojson(file: pathlib.Path) -> npt.NDArray[shapely.LineString]:
         return linestring_array
 
 
+def get_endpoints(
+    linestring_array: npt.NDArray[shapely.LineString],
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """Get the coordinates of the first and last point of each line.
+
+    Every coordinate is read in a single pass, rather than extracting each endpoint
+    separately.
+
+    Args:
+        linestring_array: A numpy array of LineString.
+
+    Returns:
+        A tuple of two (N, 2) numpy arrays, containing the first and last coordinate of
+        each line.
+    """
+    coords, coord_index = shapely.get_coordinates(linestring_array, return_index=True)
+    line_index = np.arange(len(linestring_array))
+
+    first_coord = np.searchsorted(coord_index, line_index)
+    last_coord = np.searchsorted(coord_index, line_index, side="right") - 1
+
+    return coords[first_coord], coords[last_coord]
+
+
 def clip_lines_to_points(
     point_array: npt.NDArray[shapely.Point],
     linestring_array: npt.NDArray[shapely.LineString],
+    tree: shapely.STRtree,
     buffer_size: int = 2,
 ) -> npt.NDArray[shapely.LineString]:
     """Clip the line features to a small buffer around each node.
@@ -45,58 +70,80 @@ def clip_lines_to_points(
     Args:
         point_array: A numpy array of Point to buffer and clip lines to.
         linestring_array: A numpy array of LineString to clip.
+        tree: A spatial index of `linestring_array`, so it can be built once and shared.
         buffer_size: Unitless size of the buffer around each node. Default 2.
 
     Returns:
         A numpy array of LineString. Each shares a point with a Node and is the length
         of the buffer size.
     """
-    # Create geodataframes from linestring and node arrays, to use overlay
-    lines_gdf = gpd.GeoDataFrame(linestring_array, columns=["geometry"])
-    buffer_gdf = gpd.GeoDataFrame(
-        shapely.buffer(point_array, 2, quad_segs=16), columns=["geometry"]
-    )
-
-    # Clip lines with overlay
-    cut_lines: npt.NDArray[shapely.LinearString] = lines_gdf.overlay(
-        buffer_gdf
-    ).to_numpy()
-    return cut_lines
+    buffers = shapely.buffer(point_array, buffer_size, quad_segs=16)
 
+    # Find line and buffer pairs that intersect with a bulk query of the line tree
+    buffer_index, line_index = tree.query(buffers, predicate="intersects")
 
-def _split_polygon_by_linestrings(
-    polygon: shapely.Polygon, linestrings: list[shapely.LineString]
-) -> shapely.GeometryCollection:
-    """Split a polygon into a collection of polygons with many lines.
+    # Clip each pair at once, exploding any multi-part results
+    clipped = shapely.get_parts(
+        shapely.intersection(linestring_array[line_index], buffers[buffer_index])
+    )
 
-    Args:
-        polygon: The polygon to split.
-        linestrings: The lines with which to split the polygon. Assumes the lines cross
-          the polygon boundaries.
+    # Omit points from lines that only touch a buffer
+    cut_lines: npt.NDArray[shapely.LineString] = clipped[
+        shapely.get_type_id(clipped) == shapely.GeometryType.LINESTRING
+    ]
+    return cut_lines
 
-    """
-    all_lines = [*linestrings, polygon.boundary]
 
-    merged_lines = shapely.ops.linemerge(all_lines)
-    border_lines = shapely.ops.unary_union(merged_lines)
-    decomposition = shapely.polygonize([border_lines])
+def calculate_node_angles(
+    points: npt.NDArray[shapely.Point],
+    lines: npt.NDArray[shapely.LineString],
+    line_counts: npt.NDArray[np.uint32],
+) -> npt.NDArray[np.float64]:
+    """Calculate the angles between an arbitrary number of lines entering each node.
 
-    return decomposition
+    The direction each line leaves its node is taken from the line's farther endpoint,
+    so no polygon operations are needed. The angles are the gaps between consecutive
+    line directions around each node, which always sum to 360 degrees.
 
+    The lines are passed as one flat array rather than a list per node, so every step
+    is a single numpy operation across all nodes.
 
-def calculate_node_angles(polygon_wkt: str, lines_wkt: list[str]) -> list[float]:
-    """Calculate the angles between an arbitrary number of lines entering a point.
+    Each line must leave its node only once, as it gives a single direction. A line
+    passing through a node must be split at the node first, into one line for each
+    direction it leaves in.
 
     Args:
-        polygon_wkt: A polygon representing the buffer around a point, as a WKT string.
-        lines_wkt: A list of lines intersecting a point, as WKT strings.
+        points: A numpy array of the node points.
+        lines: A flat numpy array of the lines entering each node, grouped by node in
+          the same order as `points`. Each line starts or ends at its node.
+        line_counts: The number of lines entering each node. Must be at least 1.
 
     Returns:
-        A list of angles between each line in degrees.
+        A flat numpy array of the angles between the lines of each node in degrees.
+        Each node has as many angles as lines, grouped in the same order as `lines`.
     """
-    buffer_polygon = shapely.from_wkt(polygon_wkt)
-    lines = [shapely.from_wkt(line) for line in lines_wkt]
+    node_coords = np.repeat(shapely.get_coordinates(points), line_counts, axis=0)
+
+    # Vectors from the node to both line endpoints, keeping the farther of the two
+    start, end = get_endpoints(lines)
+    start -= node_coords
+    end -= node_coords
+    use_end = np.hypot(end[:, 0], end[:, 1]) >= np.hypot(start[:, 0], start[:, 1])
+    direction = np.where(use_end[:, np.newaxis], end, start)
+    bearings = np.arctan2(direction[:, 1], direction[:, 0])
+
+    # Sort the bearings around each node, keeping the nodes in order
+    owners = np.repeat(np.arange(len(line_counts)), line_counts)
+    bearings = bearings[np.lexsort((bearings, owners))]
+
+    # Angle to the next line around the node, wrapping the last line to the first
+    node_starts = np.cumsum(line_counts) - line_counts
+    node_ends = node_starts + line_counts - 1
+    next_line = np.arange(len(bearings)) + 1
+    next_line[node_ends] = node_starts
+
+    gaps = bearings[next_line] - bearings
+    gaps[node_ends] += 2 * np.pi
+    degrees: npt.NDArray[np.float64] = np.degrees(gaps)
 
-    sub_polygons = _split_polygon_by_linestrings(buffer_polygon, lines)
-    degrees = [(slice.area / buffer_polygon.area) * 360 for slice in sub_polygons.geoms]
     return degrees
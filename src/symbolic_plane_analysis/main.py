@@ -1,6 +1,8 @@
 """Main module."""
 
 
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 import polars as pl
@@ -19,6 +21,43 @@ from symbolic_plane_analysis.files import find_geojson
 # Ister seems to have a hard time. I think it's coordinate system related
 SKIP: list[str] = []
 ANGLE_BUFFER = 15
+# Log each file as it is worked, in addition to the progress bar
+VERBOSE = False
+
+
+def _analyze_feature(feature: Path, complex_results_dir: Path) -> pl.DataFrame:
+    """Run the analyses on a single line feature file.
+
+    This runs in a worker process, so each file is analyzed in parallel.
+
+    Args:
+        feature: The path to the line features.
+        complex_results_dir: The directory to save the complex analysis csv file to.
+
+    Returns:
+        The node summary row for the line features.
+    """
+    # Perform node analysis
+    node_summary_result, node_analysis_result = node_analysis.do_analysis(
+        feature,
+        angle_buffer=ANGLE_BUFFER,
+    )
+
+    # TODO: Perform polygon analysis
+
+    # Perform the complex analysis
+    complex_analysis = (
+        node_analysis_result.group_by("num_lines")
+        .len(name="count")  # GroupBy.count is deprecated
+        .sort("num_lines")
+        .collect()
+    )
+    # TODO:
+    # polygon_analysis_result.group_by("num_sides").len(name="count").collect()
+
+    complex_analysis.write_csv(complex_results_dir / f"{feature.stem}_complex.csv")
+
+    return node_summary_result.collect()
 
 
 def main() -> None:
@@ -33,59 +72,49 @@ def main() -> None:
 
     # TODO: Create directories
 
-    geojson_files = find_geojson(directory)
+    geojson_files = sorted(find_geojson(directory))
     tasks = len(geojson_files)
 
-    with Progress(
-        SpinnerColumn(),
-        BarColumn(),
-        # TaskProgressColumn(),
-        MofNCompleteColumn(),
-        TimeElapsedColumn(),
-        transient=True,
-    ) as progress:
+    # Polars is multithreaded, so worker processes must be spawned rather than forked
+    with (
+        Progress(
+            SpinnerColumn(),
+            BarColumn(),
+            # TaskProgressColumn(),
+            MofNCompleteColumn(),
+            TimeElapsedColumn(),
+            transient=True,
+        ) as progress,
+        ProcessPoolExecutor(mp_context=multiprocessing.get_context("spawn")) as pool,
+    ):
         task = progress.add_task("Script progress.", total=tasks)
 
-        results = []
+        futures = {}
 
-        for feature in sorted(geojson_files):
+        for feature in geojson_files:
             # Format name from file stem
             name = feature.stem.title().replace("_", " ")
 
-            progress.console.log(f"Working {name}")
-
             if name in SKIP:
                 progress.update(task, advance=1, name=name)
                 continue
 
-            # Perform node analysis
-            progress.console.log("\tNode...")
-            node_summary_result, node_analysis_result = node_analysis.do_analysis(
-                feature,
-                angle_buffer=ANGLE_BUFFER,
-            )
-            results.append(node_summary_result.collect())
-
-            # TODO: Perform polygon analysis
-            progress.console.log("\tCell...")
-
-            # Perform the complex analysis
-            progress.console.log("\tComplex...")
-            complex_analysis = (
-                node_analysis_result.group_by("num_points")
-                .count()
-                .sort("num_points")
-                .collect()
-            )
-            # TODO:
-            # polygon_analysis_result.group_by("num_sides").count().collect()
-
-            complex_analysis.write_csv(
-                complex_results_dir / f"{feature.stem}_complex.csv"
-            )
+            # Every file is submitted up front, so it is only queued at this point
+            if VERBOSE:
+                progress.console.log(f"Queued {name}")
+
+            future = pool.submit(_analyze_feature, feature, complex_results_dir)
+            futures[future] = name
 
+        for future in as_completed(futures):
+            name = futures[future]
+            if VERBOSE:
+                progress.console.log(f"Finished {name}")
             progress.update(task, advance=1, name=name)
 
+        # Keep the results in file order, regardless of completion order
+        results = [future.result() for future in futures]
+
     # Compile and save to csv file
     results_df: pl.DataFrame = pl.concat(results)
     results_df.write_csv(results_dir / "results.csv")
@@ -9,6 +9,7 @@ import shapely
 from symbolic_plane_analysis.geometry import (
     calculate_node_angles,
     clip_lines_to_points,
+    get_endpoints,
     load_geojson,
 )
 
@@ -22,23 +23,22 @@ def create_lines_dataframe(
         linestring_array: A numpy array of LineString containing all the line features.
 
     Returns:
-        A polars DataFrame with the line features.
+        A polars DataFrame with the endpoints of the line features, one row per
+        endpoint. Rather than storing the geometry as python objects, each line is
+        referenced by its index in `linestring_array`.
     """
-    # Convert linestring to two arrays of coordinates
-    point_1 = shapely.get_coordinates(shapely.get_point(linestring_array, 0))
-    point_2 = shapely.get_coordinates(shapely.get_point(linestring_array, 1))
-
-    df_linestring = pl.from_numpy(linestring_array, schema=["geometry"], orient="row")
-    df_point_1 = pl.from_numpy(point_1, schema=["point_1_x", "point_1_y"], orient="row")
-    df_point_2 = pl.from_numpy(point_2, schema=["point_2_x", "point_2_y"], orient="row")
-
-    df = pl.concat([df_linestring, df_point_1, df_point_2], how="horizontal")
-
-    query = df.lazy().select(
-        pl.col("geometry"),
-        pl.concat_list("point_1_x", "point_1_y").alias("point_1"),
-        pl.concat_list("point_2_x", "point_2_y").alias("point_2"),
-    )
+    point_1, point_2 = get_endpoints(linestring_array)
+    line_index = np.arange(len(point_1), dtype=np.uint32)
+
+    # Stack both endpoints of every line, so the frame is already one row per endpoint
+    endpoints = np.concatenate([point_1, point_2])
+    query = pl.DataFrame(
+        {
+            "line_index": np.concatenate([line_index, line_index]),
+            "x_coord": endpoints[:, 0],
+            "y_coord": endpoints[:, 1],
+        }
+    ).lazy()
     return query
 
 
@@ -53,138 +53,186 @@ def create_nodes_dataframe(
 
     Returns:
         A polars DataFrame with valid intersection nodes. Each point in this DataFrame
-        is contained in at least 3 lines.
+        is contained in at least 3 lines, and keeps the integer keys it was grouped on.
     """
     coords = shapely.get_coordinates(linestring_array)
-    coord_df = pl.from_numpy(
-        coords, schema=["x_coord", "y_coord"], orient="row"
-    ).select(
-        pl.col("x_coord").round(4),
-        pl.col("y_coord").round(4),
-    )  # Round to 4 digits to fix floating point issues
+    coord_df = pl.from_numpy(coords, schema=["x_coord", "y_coord"], orient="row")
 
-    query = (
+    node_df = (
         coord_df.lazy()
-        .with_columns(
-            pl.count("x_coord").over(["x_coord", "y_coord"]).alias("num_coords")
+        .with_columns(  # Key on 4 digits to fix floating point issues
+            _coordinate_key(pl.col("x_coord")).alias("x_key"),
+            _coordinate_key(pl.col("y_coord")).alias("y_key"),
         )
-        .filter(pl.col("num_coords") != 2)  # Omit points with 2 instances
-        .unique()  # drop duplicates
-        .with_columns(
-            pl.struct(["x_coord", "y_coord"])
-            .map_elements(
-                lambda struct: shapely.to_wkt(
-                    shapely.Point(struct["x_coord"], struct["y_coord"])
-                )
-            )
-            .alias("geometry")
+        .group_by(["x_key", "y_key"])  # Count and drop duplicates in one pass
+        .agg(
+            pl.len().cast(pl.UInt8).alias("num_coords"),  # Counts are always small
+            pl.col("x_coord").first().round(4),
+            pl.col("y_coord").first().round(4),
         )
+        .filter(pl.col("num_coords") != 2)  # Omit points with 2 instances
+        .collect(streaming=True)  # Aggregate in chunks, rather than all coordinates
     )
+
+    query = node_df.lazy()
     return query
 
 
 def _filter_endpoint_nodes(
-    point: shapely.Point,
-    buffer: shapely.Polygon,
+    points: npt.NDArray[shapely.Point],
+    point_keys: npt.NDArray[np.int64],
     lines_array: npt.NDArray[shapely.LineString],
-) -> list[str]:
-    """Filter nodes that are either T/Y intersections or 'dead end' nodes."""
-    intersections = shapely.intersection(buffer, lines_array)
+    tree: shapely.STRtree,
+) -> tuple[npt.NDArray[shapely.LineString], npt.NDArray[np.intp]]:
+    """Filter nodes that are either T/Y intersections or 'dead end' nodes.
+
+    Every node is handled at once. Candidate lines come from a single bulk query of the
+    line tree, and each intersecting line is split at its node with vectorized calls.
+    Line coordinates are matched to their node by integer key, as in the node and
+    endpoint join, so both sides are rounded the same way.
+
+    Returns:
+        A tuple of the line segments entering the nodes, and the index of the node in
+        `points` that each segment belongs to. Dead end nodes have no segments.
+    """
+    buffers = shapely.buffer(points, 1, quad_segs=16)
 
     # Get intersecting lines
-    line_index = np.where(~shapely.is_empty(intersections))
-    intersecting_lines = lines_array[line_index]
+    node_index, line_index = tree.query(buffers, predicate="intersects")
 
-    # Return early for invalid nodes
-    if len(intersecting_lines) == 1:
-        return []
+    # Drop invalid nodes, which only intersect a single line
+    valid = np.bincount(node_index, minlength=len(points))[node_index] > 1
+    node_index, line_index = node_index[valid], line_index[valid]
 
-    node_point = point.coords[0]
+    # Split intersecting lines at point, one segment per line coordinate
+    coords, coord_index = shapely.get_coordinates(
+        lines_array[line_index], return_index=True
+    )
+    coord_node = node_index[coord_index]
+    node_coords = shapely.get_coordinates(points)[coord_node]
+
+    # If line contains node point it doesn't need to be split
+    is_split = np.any(_coordinate_keys(coords) != point_keys[coord_node], axis=1)
+
+    segments: npt.NDArray[shapely.LineString] = shapely.linestrings(
+        np.stack([coords[is_split], node_coords[is_split]], axis=1)
+    )
+    return segments, coord_node[is_split]
 
-    # Split intersecting lines at point
-    exploded_lines = []
-    for line in intersecting_lines:
-        for coord_pair in line.coords:
-            x_coord = round(coord_pair[0], 4)
-            y_coord = round(coord_pair[1], 4)
 
-            coord = (x_coord, y_coord)
+def _coordinate_key(coord: pl.Expr) -> pl.Expr:
+    """Convert a coordinate to an integer of 1/10000 units, to join on exactly.
 
-            # If line contains node point it doesn't need to be split
-            if node_point == coord:
-                continue
+    Integer keys are cheaper to hash than floats, and avoid float equality issues.
+    """
+    return (coord * 10_000).round(0).cast(pl.Int64)
 
-            segment = shapely.to_wkt(shapely.LineString([coord, node_point]))
 
-            exploded_lines.append(segment)
+def _coordinate_keys(coords: npt.NDArray[np.float64]) -> npt.NDArray[np.int64]:
+    """Convert coordinates to integer keys outside of polars, see `_coordinate_key`.
 
-    return exploded_lines
+    Ties are rounded away from zero, as polars does, rather than to even like `np.rint`.
+    """
+    scaled = coords * 10_000
+    rounded = np.trunc(scaled)
+    rounded += np.where(np.abs(scaled - rounded) >= 0.5, np.sign(scaled), 0)
+    keys: npt.NDArray[np.int64] = rounded.astype(np.int64)
+    return keys
 
 
 def _prepare_node_dataframe(
     node_df: pl.LazyFrame,
     line_df: pl.LazyFrame,
-    line_array: npt.NDArray[shapely.LineString],
 ) -> pl.LazyFrame:
     """Prepare the node dataframe for analysis.
 
-    The dataframe returned from this function contains all intersection nodes and the
-    lines that intersect each node.
+    The dataframe returned from this function contains the row of each intersection node
+    in `node_df`, and the index of each line that ends at the node. The indices refer to
+    the line array the line dataframe was created from, so no geometry is serialized
+    here. Nodes without any line ending at them have a null list.
     """
-    melt = line_df.melt(id_vars="geometry", value_vars=["point_1", "point_2"]).select(
-        pl.all().exclude("value"),
-        pl.col("value").list.get(0).round(4).alias("x_coord"),
-        pl.col("value").list.get(1).round(4).alias("y_coord"),
+    endpoint_lines = (
+        line_df.select(
+            pl.col("line_index"),
+            _coordinate_key(pl.col("x_coord")).alias("x_key"),
+            _coordinate_key(pl.col("y_coord")).alias("y_key"),
+        )
+        .group_by(["x_key", "y_key"])  # Group before joining, so nodes aren't repeated
+        .agg(pl.col("line_index").alias("node_lines"))
     )
 
     query = (
-        node_df.join(other=melt, on=["x_coord", "y_coord"], how="left")
-        .with_columns(  # Convert all shapely objects to string
-            pl.col("geometry_right").map_elements(lambda line: shapely.to_wkt(line)),
-        )
-        .select(["geometry", "geometry_right", "num_coords"])
-        .group_by(pl.col("geometry"))
-        .agg(
-            pl.col("geometry_right").alias("node_lines"),  # Group lines into list
-            pl.col("num_coords")
-            .mean()
-            .cast(pl.Int8)  # Will always be a whole number
-            .alias("num_coords"),  # Count number of lines
-        )
-        .with_columns(  # Buffer points
-            pl.col("geometry")
-            .map_elements(
-                lambda point: shapely.to_wkt(
-                    shapely.buffer(shapely.from_wkt(point), 1, quad_segs=16)
-                ),
-            )
-            .alias("buffer")
-        )
-        .with_columns(  # Filter nodes with count of 1
-            pl.when(pl.col("num_coords") == 1)
-            .then(
-                pl.struct(["geometry", "buffer"]).map_elements(
-                    lambda struct: _filter_endpoint_nodes(
-                        shapely.from_wkt(struct["geometry"]),
-                        shapely.from_wkt(struct["buffer"]),
-                        line_array,
-                    ),
-                    return_dtype=pl.List(pl.Utf8),
-                )
-            )
-            .otherwise(pl.col("node_lines"))
-            .alias("node_lines")
-        )
-        .with_columns(pl.col("node_lines").list.len().alias("num_lines"))
-        .select("geometry", "buffer", "node_lines", "num_lines")
-        .filter(pl.col("num_lines") > 0)
+        node_df.with_row_index("node")  # Row of each node in the node dataframe
+        .select(["node", "num_coords", "x_key", "y_key"])
+        .join(other=endpoint_lines, on=["x_key", "y_key"], how="left")
+        .select(["node", "num_coords", "x_key", "y_key", "node_lines"])
     )
 
     return query
 
 
+def _collect_node_lines(
+    points: npt.NDArray[shapely.Point],
+    node_df: pl.DataFrame,
+    line_array: npt.NDArray[shapely.LineString],
+) -> tuple[
+    npt.NDArray[shapely.LineString], npt.NDArray[np.uint32], npt.NDArray[np.uint32]
+]:
+    """Gather the line geometry entering each node.
+
+    Nodes with a count of 1 are either dead ends or lie along a line that was not split
+    at the node. Nodes with more coordinates than lines ending at them have a line
+    passing through. The lines of both are found with `_filter_endpoint_nodes`
+    instead, which splits every line at the node so each line leaves it only once.
+
+    A line passing through a node is split into two, one for each direction it leaves
+    the node in, but is still counted as a single line of the node.
+
+    Returns:
+        A tuple of a flat array of lines grouped by node, in the same order as `points`,
+        the number of those lines leaving each node, and the number of lines entering
+        each node.
+    """
+    num_coords = node_df.get_column("num_coords").to_numpy()
+    num_joined = node_df.get_column("node_lines").list.len().fill_null(0).to_numpy()
+    needs_split = (num_coords == 1) | (num_coords > num_joined)
+
+    # Lines ending at the other nodes are already referenced by index
+    joined_lines = (
+        node_df.select(pl.int_range(pl.len()).alias("node"), "node_lines")
+        .filter(~needs_split)
+        .explode("node_lines")
+        .drop_nulls()
+    )
+
+    endpoint_nodes = np.flatnonzero(needs_split)
+    endpoint_keys = node_df.select(["x_key", "y_key"]).to_numpy()[endpoint_nodes]
+    endpoint_lines, endpoint_owners = _filter_endpoint_nodes(
+        points[endpoint_nodes], endpoint_keys, line_array, shapely.STRtree(line_array)
+    )
+
+    lines = np.concatenate(
+        [line_array[joined_lines.get_column("node_lines").to_numpy()], endpoint_lines]
+    )
+    owners = np.concatenate(
+        [joined_lines.get_column("node").to_numpy(), endpoint_nodes[endpoint_owners]]
+    )
+
+    # Group the lines by node, keeping the nodes in order
+    node_order = np.argsort(owners, kind="stable")
+    split_counts = np.bincount(owners, minlength=len(points)).astype(np.uint32)
+
+    # Nodes on a line's vertex count each line once, however many times it was split
+    line_counts = split_counts.copy()
+    passing_through = needs_split & (num_coords != 1) & (split_counts > 0)
+    line_counts[passing_through] = num_coords[passing_through]
+
+    return lines[node_order], split_counts, line_counts
+
+
 def _create_analysis_dataframe(
     node_df: pl.LazyFrame,
+    node_points: npt.NDArray[shapely.Point],
     line_df: pl.LazyFrame,
     line_array: npt.NDArray[shapely.LineString],
     angle_buffer: float,
@@ -195,12 +243,13 @@ def _create_analysis_dataframe(
     several important variables for the nodes analysis. It computes the intersection
     angles, the node type (X, Y, T, ect), and the node regularity type.
 
-    This is a rather large function. It could be broken up, but I see no reason to do
-    so. Polars was designed with method chaining in mind, and the lazy evaluation means
-    this would likely take longer if the dataframe was broken up into smaller parts.
+    The join of the nodes to the line endpoints is materialized first, and the angles
+    are computed eagerly with numpy across every node at once. Only the classification
+    of the node types is left as a lazy polars method chain.
 
     Args:
         node_df: The dataframe containing valid intersection nodes.
+        node_points: Numpy array of the node points, in the same order as `node_df`.
         line_df: The dataframe containing the line features.
         line_array: Numpy array containing the line features.
         angle_buffer: The size of the buffer around 90 and 180 degrees for classifying
@@ -209,66 +258,81 @@ def _create_analysis_dataframe(
           angles within 80 to 100 degrees.
 
     Returns:
-        The node analysis dataframe. Each row is a node containing it's geometry, it's
-        intersection angles in degrees, the number of lines entering the node, the node
-        type, and the regularity type.
+        The node analysis dataframe. Each row is a node containing it's geometry as WKB,
+        it's intersection angles in degrees, the number of lines entering the node, the
+        node type, and the regularity type.
     """
-    pre_analysis = _prepare_node_dataframe(node_df, line_df, line_array)
+    # Build the angle range checks once, to reuse for every list evaluation
+    near_90 = pl.element().is_between(90 - angle_buffer, 90 + angle_buffer)
+    near_180 = pl.element().is_between(180 - angle_buffer, 180 + angle_buffer)
+
+    # Stream the endpoint join, which is the largest intermediate of the analysis
+    pre_analysis = _prepare_node_dataframe(node_df, line_df).collect(streaming=True)
+
+    # Keep the geometry as shapely objects, only serializing it for the output
+    points = node_points[pre_analysis.get_column("node").to_numpy()]
+    lines, split_counts, num_lines = _collect_node_lines(
+        points, pre_analysis, line_array
+    )
+
+    # Drop nodes without any lines, which have no lines in the flat line array either
+    has_lines = split_counts > 0
+    split_counts = split_counts[has_lines]
+    num_lines = num_lines[has_lines]
+
+    flat_degrees = calculate_node_angles(points[has_lines], lines, split_counts)
+
+    # Group the flat angles back into a list per node, keeping the node order
+    degrees = (
+        pl.DataFrame(
+            {
+                "node": np.repeat(np.arange(len(split_counts)), split_counts),
+                "degrees": flat_degrees,
+            }
+        )
+        .group_by("node", maintain_order=True)
+        .agg(pl.col("degrees"))
+        .get_column("degrees")
+    )
 
-    # Join nodes and lines, aggregate linestrings into lists
     query = (
-        pre_analysis.with_columns(  # Calculate node angles
-            pl.struct(["buffer", "node_lines"])  # Grab geometry columns, as strings
-            .map_elements(
-                lambda struct: calculate_node_angles(
-                    struct["buffer"], struct["node_lines"]
+        pl.DataFrame(
+            [
+                pl.Series(
+                    "geometry", shapely.to_wkb(points[has_lines]), dtype=pl.Binary
                 ),
-                return_dtype=pl.List(pl.Float64),
-            )
-            .list.eval(pl.element().round(2), parallel=True)
-            .alias("degrees")
+                degrees,
+                pl.Series("num_lines", num_lines),
+            ]
+        )
+        .lazy()
+        .with_columns(pl.col("degrees").list.eval(pl.element().round(2), parallel=True))
+        .with_columns(  # Evaluate each angle range once, to reuse when classifying
+            pl.col("degrees")
+            .list.eval(near_90, parallel=True)
+            .list.all()  # need to reenter the list namespace to flatten
+            .alias("all_near_90"),
+            pl.col("degrees")
+            .list.eval(near_90 | near_180, parallel=True)
+            .list.all()
+            .alias("all_near_90_or_180"),
+            pl.col("degrees")
+            .list.eval(near_180, parallel=True)
+            .list.any()
+            .alias("any_near_180"),
         )
         .with_columns(  # Classify each node type as X, T, Y, or #
             pl.when(  # X junction
-                (pl.col("num_lines") == 4)
-                & (
-                    pl.col("degrees")
-                    .list.eval(
-                        pl.element().is_between(90 - angle_buffer, 90 + angle_buffer),
-                        parallel=True,
-                    )
-                    .list.all()  # need to reenter the list namespace to flatten
-                )
+                (pl.col("num_lines") == 4) & pl.col("all_near_90")
             )
             .then(pl.lit("X", dtype=pl.Utf8))
             .when(  # T junction
-                (pl.col("num_lines") == 3)
-                & (
-                    pl.col("degrees")
-                    .list.eval(
-                        pl.element().is_between(90 - angle_buffer, 90 + angle_buffer)
-                        | pl.element().is_between(
-                            180 - angle_buffer, 180 + angle_buffer
-                        ),
-                        parallel=True,
-                    )
-                    .list.all()
-                )
+                (pl.col("num_lines") == 3) & pl.col("all_near_90_or_180")
             )
             .then(pl.lit("T", dtype=pl.Utf8))
             .when(  # Y junction
                 (pl.col("num_lines") == 3)
-                & ~(  # Simply negate the T junction calculation
-                    pl.col("degrees")
-                    .list.eval(
-                        pl.element().is_between(90 - angle_buffer, 90 + angle_buffer)
-                        | pl.element().is_between(
-                            180 - angle_buffer, 180 + angle_buffer
-                        ),
-                        parallel=True,
-                    )
-                    .list.all()
-                )
+                & ~pl.col("all_near_90_or_180")  # Simply negate the T junction check
             )
             .then(pl.lit("Y", dtype=pl.Utf8))
             .otherwise(pl.lit("#", dtype=pl.Utf8))  # None, # or other junction
@@ -282,15 +346,7 @@ def _create_analysis_dataframe(
             )
             .then(pl.lit("regular", dtype=pl.Utf8))
             .when(  # Y are regular or irregular
-                (pl.col("node_type") == "Y")  # Irregular Y
-                & (
-                    pl.col("degrees")
-                    .list.eval(
-                        pl.element().is_between(180 - angle_buffer, 180 + angle_buffer),
-                        parallel=True,
-                    )
-                    .list.any()
-                )
+                (pl.col("node_type") == "Y") & pl.col("any_near_180")  # Irregular Y
             )
             .then(pl.lit("irregular", dtype=pl.Utf8))
             .otherwise(pl.lit("regular", dtype=pl.Utf8))  # Regular Y
@@ -311,52 +367,44 @@ def _create_analysis_dataframe(
 def _create_node_summary_row(
     analysis_df: pl.LazyFrame, angle_buffer: float, row_name: str
 ) -> pl.LazyFrame:
+    near_90 = pl.element().is_between(90 - angle_buffer, 90 + angle_buffer)
+    near_180 = pl.element().is_between(180 - angle_buffer, 180 + angle_buffer)
+
     query = analysis_df.select(
         [
             pl.lit(row_name).alias("terrain"),
             pl.col("num_lines").mean().round(3).alias("n_bar"),
             pl.col("num_lines").std().round(3).alias("n_bar_std"),
             pl.col("num_lines").count().alias("node_count"),
-            (
-                pl.col("node_type").filter(pl.col("node_type") == "T").count()
-                / pl.col("node_type").count()
-            )
+            (pl.col("node_type") == "T")
+            .mean()  # Share of matching nodes, without filtering the column
+            .fill_null(float("nan"))  # No nodes is 0/0, rather than missing
             .round(3)
             .alias("ratio_T"),
-            (
-                pl.col("node_type").filter(pl.col("node_type") == "Y").count()
-                / pl.col("node_type").count()
-            )
+            (pl.col("node_type") == "Y")
+            .mean()
+            .fill_null(float("nan"))
             .round(3)
             .alias("ratio_Y"),
-            (
-                pl.col("node_type").filter(pl.col("node_type") == "X").count()
-                / pl.col("node_type").count()
-            )
+            (pl.col("node_type") == "X")
+            .mean()
+            .fill_null(float("nan"))
             .round(3)
             .alias("ratio_X"),
-            (
-                pl.col("node_type").filter(pl.col("node_type") == "#").count()
-                / pl.col("node_type").count()
-            )
+            (pl.col("node_type") == "#")
+            .mean()
+            .fill_null(float("nan"))
             .round(3)
             .alias("ratio_#"),
-            (
-                pl.col("degrees")
-                .explode()
-                .is_between(180 - angle_buffer, 180 + angle_buffer)
-                .sum()
-                / pl.col("degrees")
-                .explode()
-                .is_between(90 - angle_buffer, 90 + angle_buffer)
-                .sum()
+            (  # Count within each list, rather than exploding the column twice
+                pl.col("degrees").list.eval(near_180, parallel=True).list.sum().sum()
+                / pl.col("degrees").list.eval(near_90, parallel=True).list.sum().sum()
             )
             .round(3)
             .alias("ratio_180_90"),
-            (
-                pl.col("regularity").filter(pl.col("regularity") == "regular").count()
-                / pl.col("regularity").count()
-            )
+            (pl.col("regularity") == "regular")
+            .mean()
+            .fill_null(float("nan"))
             .round(3)
             .alias("regularity"),
         ]
@@ -389,18 +437,28 @@ def do_analysis(
     line_features_array = load_geojson(feature_path)
     nodes_df = create_nodes_dataframe(line_features_array)
 
-    # Clip lines to the node buffer. This uses geopandas
-    clipped_lines = clip_lines_to_points(
-        shapely.from_wkt(nodes_df.select("geometry").collect().to_numpy()),
-        line_features_array,
+    # Index the line features once, for any spatial queries against them
+    line_tree = shapely.STRtree(line_features_array)
+
+    # Create every node point once, in a single vectorized call
+    node_points = shapely.points(
+        nodes_df.select(["x_coord", "y_coord"]).collect().to_numpy()
     )
 
+    # Clip lines to the node buffer
+    clipped_lines = clip_lines_to_points(node_points, line_features_array, line_tree)
+
     # Create lines dataframe from our shortened lines
     lines_df = create_lines_dataframe(clipped_lines)
 
-    # Perform analysis and summarize
-    node_analysis_df = _create_analysis_dataframe(
-        nodes_df, lines_df, clipped_lines, angle_buffer
+    # Perform analysis and summarize. The analysis is materialized once, so the summary
+    # and any later queries on it don't each rerun the whole plan.
+    node_analysis_df = (
+        _create_analysis_dataframe(
+            nodes_df, node_points, lines_df, clipped_lines, angle_buffer
+        )
+        .collect()
+        .lazy()
     )
     summary_df = _create_node_summary_row(
         node_analysis_df, angle_buffer, feature_path.stem
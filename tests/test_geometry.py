@@ -0,0 +1,65 @@
+"""Tests for the geometry module."""
+
+import numpy as np
+import pytest
+import shapely
+
+from symbolic_plane_analysis.geometry import calculate_node_angles
+
+# Each case is a node, the far end of each line leaving it, and the expected angles
+NodeCase = tuple[tuple[float, float], list[tuple[float, float]], list[float]]
+
+NODE_CASES: dict[str, NodeCase] = {
+    "X": ((0, 0), [(1, 0), (0, 1), (-1, 0), (0, -1)], [90.0, 90.0, 90.0, 90.0]),
+    "T": ((0, 0), [(1, 0), (-1, 0), (0, 1)], [90.0, 90.0, 180.0]),
+    "Y": (
+        (0, 0),
+        [(0, 1), (-np.sqrt(3) / 2, -0.5), (np.sqrt(3) / 2, -0.5)],
+        [120.0, 120.0, 120.0],
+    ),
+    # A line passing through the node, split into the two directions it leaves in
+    "through line": (
+        (520, 110),
+        [(500, 100), (540, 100), (540, 130), (520, 140)],
+        [45.0, 71.57, 116.57, 126.87],
+    ),
+}
+
+
+def _node_lines(
+    node: tuple[float, float], ends: list[tuple[float, float]]
+) -> list[shapely.LineString]:
+    """Create a line from the node to each end."""
+    return [shapely.LineString([node, end]) for end in ends]
+
+
+@pytest.mark.parametrize("case", NODE_CASES.values(), ids=NODE_CASES.keys())
+def test_calculate_node_angles(case: NodeCase) -> None:
+    """Angles between the lines of a single node."""
+    node, ends, expected = case
+
+    degrees = calculate_node_angles(
+        np.array([shapely.Point(node)]),
+        np.array(_node_lines(node, ends)),
+        np.array([len(ends)], dtype=np.uint32),
+    )
+
+    assert sorted(degrees) == pytest.approx(expected, abs=0.01)
+
+
+def test_calculate_node_angles_grouped() -> None:
+    """Angles of several nodes in one call stay grouped by node, in order."""
+    points = []
+    lines = []
+    for node, ends, _ in NODE_CASES.values():
+        points.append(shapely.Point(node))
+        lines.extend(_node_lines(node, ends))
+    line_counts = np.array([len(ends) for _, ends, _ in NODE_CASES.values()])
+
+    degrees = calculate_node_angles(
+        np.array(points), np.array(lines), line_counts.astype(np.uint32)
+    )
+
+    node_degrees = np.split(degrees, np.cumsum(line_counts)[:-1])
+    for angles, (_, _, expected) in zip(node_degrees, NODE_CASES.values()):
+        assert sorted(angles) == pytest.approx(expected, abs=0.01)
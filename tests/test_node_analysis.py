@@ -0,0 +1,143 @@
+"""Tests for the node analysis."""
+
+import json
+import pathlib
+
+import numpy as np
+import polars as pl
+import pytest
+import shapely
+
+from symbolic_plane_analysis.node_analysis import (
+    _coordinate_key,
+    _coordinate_keys,
+    _filter_endpoint_nodes,
+    do_analysis,
+)
+
+# A coordinate that is exactly halfway between two keys
+TIE = 0.00005
+
+
+def _write_geojson(
+    directory: pathlib.Path, lines: list[list[list[float]]]
+) -> pathlib.Path:
+    """Write line coordinates to a geoJSON file of LineString features."""
+    features = [
+        {
+            "type": "Feature",
+            "properties": {},
+            "geometry": {"type": "LineString", "coordinates": coords},
+        }
+        for coords in lines
+    ]
+    file = directory / "lines.geojson"
+    file.write_text(json.dumps({"type": "FeatureCollection", "features": features}))
+    return file
+
+
+def test_node_on_line_vertex(tmp_path: pathlib.Path) -> None:
+    """A node on an interior vertex of one line, with two other lines ending at it."""
+    feature_path = _write_geojson(
+        tmp_path,
+        [
+            [[500, 100], [520, 110], [540, 100], [560, 112]],
+            [[520, 110], [540, 130]],
+            [[520, 110], [520, 140]],
+        ],
+    )
+
+    _, node_analysis_df = do_analysis(feature_path, angle_buffer=15)
+    nodes = node_analysis_df.collect()
+
+    assert nodes.height == 1
+    node = nodes.row(0, named=True)
+
+    # The passing line leaves the node twice, but is counted as one line
+    assert node["num_lines"] == 3
+    assert node["node_type"] == "Y"
+    assert sorted(node["degrees"]) == pytest.approx([45.0, 71.57, 116.57, 126.87])
+
+
+@pytest.mark.parametrize(
+    "lines",
+    [
+        [[[0, 0], [20, 0]], [[10, 0], [10, 15]]],
+        [[[-10, TIE], [10, TIE]], [[TIE, TIE], [TIE, 10]]],
+    ],
+    ids=["T", "T on a rounding tie"],
+)
+def test_node_along_line(
+    tmp_path: pathlib.Path, lines: list[list[list[float]]]
+) -> None:
+    """A T junction, where the passing line has no vertex at the node."""
+    feature_path = _write_geojson(tmp_path, lines)
+
+    _, node_analysis_df = do_analysis(feature_path, angle_buffer=15)
+    nodes = node_analysis_df.collect()
+
+    assert nodes.height == 1
+    node = nodes.row(0, named=True)
+
+    # The passing line is split in two. Irregular nodes count it as one line
+    assert node["node_type"] == "T"
+    assert node["num_lines"] == 2
+    assert sorted(node["degrees"]) == pytest.approx([90.0, 90.0, 180.0])
+
+
+def test_filter_endpoint_nodes_tie() -> None:
+    """A node on a rounding tie recognises its own vertex, and isn't split to it."""
+    lines = np.array(
+        [
+            shapely.LineString([(-10, TIE), (10, TIE)]),
+            shapely.LineString([(TIE, TIE), (TIE, 10)]),
+        ]
+    )
+    node_keys = (
+        pl.DataFrame({"x": [TIE], "y": [TIE]})
+        .select(_coordinate_key(pl.col("x")), _coordinate_key(pl.col("y")))
+        .to_numpy()
+    )
+
+    segments, owners = _filter_endpoint_nodes(
+        shapely.points([(TIE, TIE)]), node_keys, lines, shapely.STRtree(lines)
+    )
+
+    assert len(segments) == 3
+    assert np.all(owners == 0)
+    assert shapely.length(segments).min() > 1
+
+
+def test_coordinate_keys_match_polars() -> None:
+    """The numpy and polars coordinate keys round every coordinate the same way."""
+    rng = np.random.default_rng(0)
+    ties = (np.arange(-5000, 5000) + 0.5) / 10_000
+    coords = np.concatenate(
+        [
+            ties,
+            np.round(rng.uniform(-1e3, 1e3, 100_000), 5),
+            rng.uniform(-1e6, 1e6, 100_000),
+        ]
+    )
+
+    polars_keys = (
+        pl.Series("coord", coords)
+        .to_frame()
+        .select(_coordinate_key(pl.col("coord")))
+        .to_series()
+        .to_numpy()
+    )
+
+    np.testing.assert_array_equal(_coordinate_keys(coords), polars_keys)
+
+
+def test_summary_without_nodes(tmp_path: pathlib.Path) -> None:
+    """A file without any valid nodes has NaN ratios, rather than missing values."""
+    feature_path = _write_geojson(tmp_path, [[[0, 0], [5, 5], [10, 0]]])
+
+    summary_df, _ = do_analysis(feature_path, angle_buffer=15)
+    summary = summary_df.collect().row(0, named=True)
+
+    assert summary["node_count"] == 0
+    for column in ["ratio_T", "ratio_Y", "ratio_X", "ratio_#", "regularity"]:
+        assert np.isnan(summary[column])